@@ -7,14 +7,19 @@ ClawCloud 自动登录脚本
 """
 
 import base64
+import json
 import os
 import random
 import re
 import sys
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from urllib.parse import urlparse
 
 import requests
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from playwright.sync_api import sync_playwright
 
 # ==================== 配置 ====================
@@ -27,6 +32,75 @@ LOGIN_ENTRY_URL = "https://ap-northeast-1.run.claw.cloud/login"
 SIGNIN_URL = f"{LOGIN_ENTRY_URL}/signin"
 DEVICE_VERIFY_WAIT = 30  # Mobile验证 默认等 30 秒
 TWO_FACTOR_WAIT = int(os.environ.get("TWO_FACTOR_WAIT", "120"))  # 2FA验证 默认等 120 秒
+# 浏览器登录状态文件（Cookie + localStorage），存在时下次运行直接复用，可跳过 GitHub 登录
+STORAGE_STATE = os.environ.get("STORAGE_STATE", "state.json").strip()
+# 设为任意非空值时保留中间步骤截图（排查问题用）
+DEBUG_SCREENSHOTS = bool(os.environ.get("DEBUG_SCREENSHOTS", "").strip())
+
+# OAuth 回调、登录等中转页面的路径关键字，出现时说明还没到控制台
+TRANSIT_PATH_KEYWORDS = ("callback", "oauth", "login", "signin")
+
+# 日志级别图标
+LOG_ICONS = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
+# 保留的日志行数（通知里只用最后几行）
+LOG_KEEP = 32
+
+# ClawCloud 登录页上的 GitHub 按钮
+GITHUB_BTN_SELECTORS = (
+    'button:has-text("GitHub")',
+    'a:has-text("GitHub")',
+    '[data-provider="github"]',
+)
+# GitHub OAuth 授权按钮
+OAUTH_AUTH_SELECTORS = (
+    'button[name="authorize"]',
+    'button:has-text("Authorize")',
+)
+# 两步验证页面切换到验证码输入的入口
+TWO_FACTOR_SWITCH_SELECTORS = (
+    'a:has-text("Use an authentication app")',
+    'a:has-text("Enter a code")',
+    'button:has-text("Use an authentication app")',
+    'button:has-text("Authenticator app")',
+    '[href*="two-factor/app"]',
+)
+# 常见 OTP 输入框（优先级排序）
+OTP_SELECTORS = (
+    'input[autocomplete="one-time-code"]',
+    'input[name="app_otp"]',
+    'input[name="otp"]',
+    'input#app_totp',
+    'input#otp',
+    'input[inputmode="numeric"]',
+)
+VERIFY_BTN_SELECTORS = (
+    'button:has-text("Verify")',
+    'button[type="submit"]',
+    'input[type="submit"]',
+)
+SUBMIT_SELECTOR = 'input[type="submit"], button[type="submit"]'
+ERROR_SELECTOR = '.flash-error'
+OTP_FIELD_SELECTOR = 'input[name="otp"], input[name="app_otp"]'
+
+# 提交登录表单后一次性读取页面状态：URL、可见的错误提示、是否出现 OTP 输入框
+POST_SUBMIT_PROBE = """([errSel, otpSel]) => {
+    const err = document.querySelector(errSel);
+    return {
+        url: location.href,
+        err: err && err.offsetParent !== null ? err.innerText.trim() : null,
+        otp: !!document.querySelector(otpSel),
+    };
+}"""
+
+# 统计/追踪域名，直接拦截（图片由启动参数 imagesEnabled=false 关闭）
+BLOCKED_HOSTS = re.compile(
+    r"^https?://([^/]+\.)?(google-analytics\.com|googletagmanager\.com|doubleclick\.net"
+    r"|hotjar\.com|segment\.io|segment\.com|sentry\.io)(:\d+)?/"
+)
+
+
+class LoginFailed(Exception):
+    """登录流程失败，由 run() 统一在关闭浏览器后通知并退出"""
 
 
 class Telegram:
@@ -36,13 +110,16 @@ class Telegram:
         self.token = os.environ.get('TG_BOT_TOKEN')
         self.chat_id = os.environ.get('TG_CHAT_ID')
         self.ok = bool(self.token and self.chat_id)
+        self.base = f"https://api.telegram.org/bot{self.token}"
+        # 复用连接，避免每次请求都重新握手
+        self.session = requests.Session()
     
     def send(self, msg):
         if not self.ok:
             return
         try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
+            self.session.post(
+                f"{self.base}/sendMessage",
                 data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
                 timeout=30
             )
@@ -50,16 +127,52 @@ class Telegram:
             pass
     
     def photo(self, path, caption=""):
-        if not self.ok or not os.path.exists(path):
+        if not self.ok:
             return
         try:
             with open(path, 'rb') as f:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
+                self.session.post(
+                    f"{self.base}/sendPhoto",
                     data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                    files={"photo": f},
+                    files={"photo": (os.path.basename(path), f, "image/jpeg")},
                     timeout=60
                 )
+        except:
+            pass  # 含 FileNotFoundError：截图失败时文件不存在
+    
+    def photos(self, items):
+        """一次请求按顺序发送多张图片（sendMediaGroup，最多 10 张），items 为 [(path, caption), ...]"""
+        if not self.ok or not items:
+            return
+        try:
+            with ExitStack() as stack:
+                files, media = {}, []
+                for path, caption in items[:10]:
+                    try:
+                        f = stack.enter_context(open(path, 'rb'))
+                    except OSError:
+                        continue  # 截图失败时文件不存在
+                    name = f"photo{len(media)}"
+                    files[name] = (os.path.basename(path), f, "image/jpeg")
+                    media.append({"type": "photo", "media": f"attach://{name}", "caption": caption[:1024]})
+                
+                if not media:
+                    return
+                # 相册至少需要 2 张，只有 1 张时按单图发送
+                if len(media) == 1:
+                    self.session.post(
+                        f"{self.base}/sendPhoto",
+                        data={"chat_id": self.chat_id, "caption": media[0]["caption"]},
+                        files={"photo": files["photo0"]},
+                        timeout=60
+                    )
+                else:
+                    self.session.post(
+                        f"{self.base}/sendMediaGroup",
+                        data={"chat_id": self.chat_id, "media": json.dumps(media)},
+                        files=files,
+                        timeout=60
+                    )
         except:
             pass
     
@@ -68,8 +181,8 @@ class Telegram:
         if not self.ok:
             return 0
         try:
-            r = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getUpdates",
+            r = self.session.get(
+                f"{self.base}/getUpdates",
                 params={"timeout": 0},
                 timeout=10
             )
@@ -95,8 +208,8 @@ class Telegram:
         
         while time.time() < deadline:
             try:
-                r = requests.get(
-                    f"https://api.telegram.org/bot{self.token}/getUpdates",
+                r = self.session.get(
+                    f"{self.base}/getUpdates",
                     params={"timeout": 20, "offset": offset},
                     timeout=30
                 )
@@ -132,38 +245,60 @@ class SecretUpdater:
         self.token = os.environ.get('REPO_TOKEN')
         self.repo = os.environ.get('GITHUB_REPOSITORY')
         self.ok = bool(self.token and self.repo)
+        self.headers = {
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        self._key_future = None
         if self.ok:
             print("✅ Secret 自动更新已启用")
         else:
             print("⚠️ Secret 自动更新未启用（需要 REPO_TOKEN）")
     
+    def _fetch_key(self):
+        """获取仓库公钥"""
+        r = requests.get(
+            f"https://api.github.com/repos/{self.repo}/actions/secrets/public-key",
+            headers=self.headers, timeout=30
+        )
+        if r.status_code != 200:
+            return None
+        return r.json()
+    
+    def prefetch(self):
+        """后台预取公钥，与浏览器启动并行"""
+        if not self.ok or self._key_future:
+            return
+        pool = ThreadPoolExecutor(max_workers=1)
+        self._key_future = pool.submit(self._fetch_key)
+        pool.shutdown(wait=False)
+    
     def update(self, name, value):
         if not self.ok:
             return False
         try:
             from nacl import encoding, public
             
-            headers = {
-                "Authorization": f"token {self.token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            # 获取公钥
-            r = requests.get(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/public-key",
-                headers=headers, timeout=30
-            )
-            if r.status_code != 200:
+            # 获取公钥（优先使用预取结果，预取失败时重新获取）
+            key_data = None
+            if self._key_future:
+                try:
+                    key_data = self._key_future.result()
+                except Exception as e:
+                    print(f"预取公钥失败，重新获取: {e}")
+                self._key_future = None
+            if not key_data:
+                key_data = self._fetch_key()
+            if not key_data:
                 return False
             
-            key_data = r.json()
             pk = public.PublicKey(key_data['key'].encode(), encoding.Base64Encoder())
             encrypted = public.SealedBox(pk).encrypt(value.encode())
             
             # 更新 Secret
             r = requests.put(
                 f"https://api.github.com/repos/{self.repo}/actions/secrets/{name}",
-                headers=headers,
+                headers=self.headers,
                 json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_data['key_id']},
                 timeout=30
             )
@@ -183,7 +318,7 @@ class AutoLogin:
         self.tg = Telegram()
         self.secret = SecretUpdater()
         self.shots = []
-        self.logs = []
+        self.logs = deque(maxlen=LOG_KEEP)
         self.n = 0
         
         # 区域相关
@@ -191,26 +326,41 @@ class AutoLogin:
         self.region_base_url = 'https://eu-central-1.run.claw.cloud'  # 检测到的区域基础 URL
         
     def log(self, msg, level="INFO"):
-        icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
-        line = f"{icons.get(level, '•')} {msg}"
+        line = f"{LOG_ICONS.get(level, '•')} {msg}"
         print(line)
         self.logs.append(line)
     
     def shot(self, page, name):
         self.n += 1
-        f = f"{self.n:02d}_{name}.png"
+        f = f"{self.n:02d}_{name}.jpg"
         try:
-            page.screenshot(path=f)
+            # JPEG 编码和上传都比 PNG 快得多，通知里看清页面足够
+            page.screenshot(path=f, type='jpeg', quality=60)
             self.shots.append(f)
         except:
             pass
         return f
     
+    def debug_shot(self, page, name):
+        """中间步骤截图，仅在 DEBUG_SCREENSHOTS 开启时保存"""
+        if DEBUG_SCREENSHOTS:
+            return self.shot(page, name)
+        return None
+    
+    def any_visible(self, page, sels):
+        """候选 selector 中第一个可见元素（隐藏的匹配项不会占住 .first）"""
+        return page.locator(", ".join(f"{s}:visible" for s in sels)).first
+    
     def click(self, page, sels, desc=""):
+        # 一次联合查询等待任一候选可见，避免逐个等待
+        try:
+            self.any_visible(page, sels).wait_for(timeout=3000)
+        except PlaywrightTimeoutError:
+            return False
         for s in sels:
             try:
                 el = page.locator(s).first
-                if el.is_visible(timeout=3000):
+                if el.is_visible():
                     # 模拟人类随机延迟
                     time.sleep(random.uniform(0.5, 1.5))
                     el.hover() # 先悬停
@@ -273,8 +423,9 @@ class AutoLogin:
     def get_session(self, context):
         """提取 Session Cookie"""
         try:
-            for c in context.cookies():
-                if c['name'] == 'user_session' and 'github' in c.get('domain', ''):
+            # 只取 github.com 的 Cookie，由浏览器按 URL 过滤
+            for c in context.cookies("https://github.com"):
+                if c['name'] == 'user_session':
                     return c['value']
         except:
             pass
@@ -325,11 +476,12 @@ class AutoLogin:
                     return True
                 try:
                     page.reload(timeout=10000)
-                    page.wait_for_load_state('networkidle', timeout=10000)
+                    page.wait_for_load_state('domcontentloaded', timeout=10000)
                 except:
                     pass
         
-        if 'verified-device' not in page.url:
+        url = page.url
+        if 'verified-device' not in url:
             return True
         
         self.log("设备验证超时", "ERROR")
@@ -385,6 +537,13 @@ class AutoLogin:
         self.tg.send("❌ <b>两步验证超时</b>")
         return False
     
+    def wait_otp_field(self, page):
+        """切换验证方式后等待验证码输入框出现"""
+        try:
+            self.any_visible(page, OTP_SELECTORS).wait_for(timeout=15000)
+        except PlaywrightTimeoutError:
+            self.log("未等到验证码输入框", "WARN")
+    
     def handle_2fa_code_input(self, page):
         """处理 TOTP 验证码输入（通过 Telegram 发送 /code 123456）"""
         self.log("需要输入验证码", "WARN")
@@ -399,36 +558,27 @@ class AutoLogin:
                 if more_options_button.is_visible(timeout=3000):
                     more_options_button.click()
                     self.log("已点击 'More options'", "SUCCESS")
-                    time.sleep(1) # 等待菜单出现
-                    self.shot(page, "点击more_options后")
+                    self.debug_shot(page, "点击more_options后")
 
                     # 点击 "Authenticator app"
                     auth_app_button = page.locator('button:has-text("Authenticator app")').first
+                    auth_app_button.wait_for(state='visible', timeout=5000)  # 等待菜单出现
                     if auth_app_button.is_visible(timeout=2000):
                         auth_app_button.click()
                         self.log("已选择 'Authenticator app'", "SUCCESS")
-                        time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
+                        self.wait_otp_field(page)
                         shot = self.shot(page, "切换到验证码输入页") # 更新截图
             except Exception as e:
                 self.log(f"切换验证方式时出错: {e}", "WARN")
 
         # (保留) 先尝试点击"Use an authentication app"或类似按钮（如果在 mobile 页面）
         try:
-            more_options = [
-                'a:has-text("Use an authentication app")',
-                'a:has-text("Enter a code")',
-                'button:has-text("Use an authentication app")',
-                'button:has-text("Authenticator app")',
-                '[href*="two-factor/app"]'
-            ]
-            for sel in more_options:
+            for sel in TWO_FACTOR_SWITCH_SELECTORS:
                 try:
                     el = page.locator(sel).first
                     if el.is_visible(timeout=2000):
                         el.click()
-                        time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
+                        self.wait_otp_field(page)
                         self.log("已切换到验证码输入页面", "SUCCESS")
                         shot = self.shot(page, "两步验证_code_切换后")
                         break
@@ -459,17 +609,7 @@ class AutoLogin:
         self.log("收到验证码，正在填入...", "SUCCESS")
         self.tg.send("✅ 收到验证码，正在填入...")
 
-        # 常见 OTP 输入框 selector（优先级排序）
-        selectors = [
-            'input[autocomplete="one-time-code"]',
-            'input[name="app_otp"]',
-            'input[name="otp"]',
-            'input#app_totp',
-            'input#otp',
-            'input[inputmode="numeric"]'
-        ]
-
-        for sel in selectors:
+        for sel in OTP_SELECTORS:
             try:
                 el = page.locator(sel).first
                 if el.is_visible(timeout=2000):
@@ -481,12 +621,7 @@ class AutoLogin:
 
                     # 优先点击 Verify 按钮，不行再 Enter
                     submitted = False
-                    verify_btns = [
-                        'button:has-text("Verify")',
-                        'button[type="submit"]',
-                        'input[type="submit"]'
-                    ]
-                    for btn_sel in verify_btns:
+                    for btn_sel in VERIFY_BTN_SELECTORS:
                         try:
                             btn = page.locator(btn_sel).first
                             if btn.is_visible(timeout=1000):
@@ -502,8 +637,10 @@ class AutoLogin:
                         page.keyboard.press("Enter")
                         self.log("已按 Enter 提交", "SUCCESS")
 
-                    time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=30000)
+                    try:
+                        page.wait_for_url(lambda u: "github.com/sessions/two-factor/" not in u, timeout=30000)
+                    except PlaywrightTimeoutError:
+                        pass
                     self.shot(page, "验证码提交后")
 
                     # 检查是否通过
@@ -525,7 +662,7 @@ class AutoLogin:
     def login_github(self, page, context):
         """登录 GitHub"""
         self.log("登录 GitHub...", "STEP")
-        self.shot(page, "github_登录页")
+        self.debug_shot(page, "github_登录页")
         
         try:
             # 模拟人工输入
@@ -546,41 +683,50 @@ class AutoLogin:
             self.log(f"输入失败: {e}", "ERROR")
             return False
         
-        self.shot(page, "github_已填写")
+        self.debug_shot(page, "github_已填写")
         
         try:
-            page.locator('input[type="submit"], button[type="submit"]').first.click()
+            page.locator(SUBMIT_SELECTOR).first.click()
         except:
             pass
         
-        time.sleep(3)
-        page.wait_for_load_state('networkidle', timeout=30000)
-        self.shot(page, "github_登录后")
+        # 等待离开登录表单（密码错误时会停留在 /session）
+        try:
+            page.wait_for_url(lambda u: urlparse(u).path not in ('/login', '/session'), timeout=15000)
+        except PlaywrightTimeoutError:
+            pass
+        self.debug_shot(page, "github_登录后")
         
-        url = page.url
+        state = self.probe(page)
+        url = state["url"]
         self.log(f"当前: {url}")
         
+        # 错误（如密码错误、请求过多）
+        if state["err"]:
+            self.log(f"错误: {state['err']}", "ERROR")
+            return False
+        
         # 设备验证
         if 'verified-device' in url or 'device-verification' in url:
             if not self.wait_device(page):
                 return False
-            time.sleep(2)
-            page.wait_for_load_state('networkidle', timeout=30000)
-            self.shot(page, "验证后")
+            page.wait_for_load_state('domcontentloaded', timeout=30000)
+            self.debug_shot(page, "验证后")
+            state = self.probe(page)
+            url = state["url"]
         
         # 2FA
-        if 'two-factor' in page.url:
+        if 'two-factor' in url or state["otp"]:
             self.log("需要两步验证！", "WARN")
-            self.shot(page, "两步验证")
+            self.debug_shot(page, "两步验证")
             
             # GitHub Mobile：等待你在手机上批准
-            if 'two-factor/mobile' in page.url:
+            if 'two-factor/mobile' in url:
                 if not self.wait_two_factor_mobile(page):
                     return False
                 # 通过后等页面稳定
                 try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
+                    page.wait_for_load_state('domcontentloaded', timeout=30000)
                 except:
                     pass
             
@@ -590,42 +736,50 @@ class AutoLogin:
                     return False
                 # 通过后等页面稳定
                 try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
+                    page.wait_for_load_state('domcontentloaded', timeout=30000)
                 except:
                     pass
+            
+            state = self.probe(page)
         
         # 错误
-        try:
-            err = page.locator('.flash-error').first
-            if err.is_visible(timeout=2000):
-                self.log(f"错误: {err.inner_text()}", "ERROR")
-                return False
-        except:
-            pass
+        if state["err"]:
+            self.log(f"错误: {state['err']}", "ERROR")
+            return False
         
         return True
     
+    def probe(self, page):
+        """一次往返获取登录提交后的页面状态"""
+        try:
+            return page.evaluate(POST_SUBMIT_PROBE, [ERROR_SELECTOR, OTP_FIELD_SELECTOR])
+        except Exception:
+            return {"url": page.url, "err": None, "otp": False}
+    
     def oauth(self, page):
         """处理 OAuth"""
         if 'github.com/login/oauth/authorize' in page.url:
             self.log("处理 OAuth...", "STEP")
-            self.shot(page, "oauth")
-            self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
-            time.sleep(3)
-            page.wait_for_load_state('networkidle', timeout=30000)
+            self.debug_shot(page, "oauth")
+            self.click(page, OAUTH_AUTH_SELECTORS, "授权")
+            try:
+                page.wait_for_url(lambda u: 'github.com/login/oauth/authorize' not in u, timeout=30000)
+            except PlaywrightTimeoutError:
+                pass
     
     def wait_redirect(self, page, wait=60):
         """等待重定向并检测区域"""
         self.log("等待重定向...", "STEP")
-        for i in range(wait):
+        deadline = time.time() + wait
+        while True:
             url = page.url
             
             # 检查是否已跳转到 claw.cloud
             if 'claw.cloud' in url and 'signin' not in url.lower():
                 self.log("重定向成功！", "SUCCESS")
                 
-                # 检测并记录区域
+                # 先到达的是 OAuth 回调页，等它完成跳转到区域控制台后再检测区域
+                url = self.settle(page)
                 self.detect_region(url)
                 
                 return True
@@ -633,13 +787,38 @@ class AutoLogin:
             if 'github.com/login/oauth/authorize' in url:
                 self.oauth(page)
             
-            time.sleep(1)
-            if i % 10 == 0:
-                self.log(f"  等待... ({i}秒)")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            # URL 一变化就返回，而不是按秒轮询
+            try:
+                page.wait_for_url(
+                    lambda u: ('claw.cloud' in u and 'signin' not in u.lower())
+                    or 'github.com/login/oauth/authorize' in u,
+                    timeout=remaining * 1000
+                )
+            except PlaywrightTimeoutError:
+                break
         
         self.log("重定向超时", "ERROR")
         return False
     
+    def is_console_url(self, url):
+        """是否已到达 ClawCloud 控制台（不在 OAuth 回调/登录等中转路径上）"""
+        parsed = urlparse(url)
+        path = parsed.path.lower()
+        return parsed.netloc.endswith('claw.cloud') and not any(k in path for k in TRANSIT_PATH_KEYWORDS)
+    
+    def settle(self, page, wait=20000):
+        """等待重定向链走到控制台页面并加载完成，返回最终 URL"""
+        try:
+            # URL 一到达控制台就返回，最后再统一等一次加载
+            page.wait_for_url(self.is_console_url, timeout=wait, wait_until='commit')
+            page.wait_for_load_state('load', timeout=wait)
+        except PlaywrightTimeoutError:
+            self.log("等待控制台页面超时，使用当前 URL", "WARN")
+        return page.url
+    
     def keepalive(self, page):
         """保活 - 使用检测到的区域 URL"""
         self.log("保活...", "STEP")
@@ -657,23 +836,61 @@ class AutoLogin:
         if self.detected_region:
             self.log(f"当前区域: {self.detected_region}", "INFO")
         
-        for url, name in pages_to_visit:
+        # 前面的页面放到新标签页，最后一个用当前页；先全部发起导航，再统一等待加载
+        tabs = [page.context.new_page() for _ in pages_to_visit[1:]] + [page]
+        started = []
+        for tab, (url, name) in zip(tabs, pages_to_visit):
+            try:
+                tab.goto(url, timeout=30000, wait_until='commit')
+                started.append((tab, url, name))
+            except Exception as e:
+                self.log(f"访问 {name} 失败: {e}", "WARN")
+        
+        for tab, url, name in started:
             try:
-                page.goto(url, timeout=30000)
-                page.wait_for_load_state('networkidle', timeout=15000)
+                tab.wait_for_load_state('load', timeout=30000)
                 self.log(f"已访问: {name} ({url})", "SUCCESS")
                 
                 # 再次检测区域（以防中途跳转）
-                current_url = page.url
+                current_url = tab.url
                 if 'claw.cloud' in current_url:
                     self.detect_region(current_url)
-                
-                time.sleep(2)
             except Exception as e:
                 self.log(f"访问 {name} 失败: {e}", "WARN")
         
+        for tab in tabs[:-1]:
+            try:
+                tab.close()
+            except:
+                pass
+        
         self.shot(page, "完成")
     
+    def save_state(self, context):
+        """保存浏览器登录状态，供下次运行复用"""
+        if not STORAGE_STATE:
+            return
+        try:
+            context.storage_state(path=STORAGE_STATE)
+            self.log(f"已保存登录状态: {STORAGE_STATE}", "SUCCESS")
+        except Exception as e:
+            self.log(f"保存登录状态失败: {e}", "WARN")
+    
+    def logged_in(self, page, context):
+        """已登录时直接保活并更新 Cookie"""
+        self.log("已登录！", "SUCCESS")
+        # 首个非 signin 地址可能只是中转页，等跳转到控制台后再检测区域
+        url = self.settle(page)
+        self.detect_region(url)
+        self.keepalive(page)
+        self.save_state(context)
+        # 提取并保存新 Cookie
+        new = self.get_session(context)
+        if new:
+            self.save_cookie(new)
+        self.notify(True)
+        print("\n✅ 成功！\n")
+    
     def notify(self, ok, err=""):
         if not self.tg.ok:
             return
@@ -689,14 +906,13 @@ class AutoLogin:
         if err:
             msg += f"\n<b>错误:</b> {err}"
         
-        msg += "\n\n<b>日志:</b>\n" + "\n".join(self.logs[-6:])
+        msg += "\n\n<b>日志:</b>\n" + "\n".join(list(self.logs)[-6:])
         
         self.tg.send(msg)
         
         if self.shots:
             if not ok:
-                for s in self.shots[-3:]:
-                    self.tg.photo(s, s)
+                self.tg.photos([(s, s) for s in self.shots[-3:]])
             else:
                 # for s in self.shots[-3:]:
                 #     self.tg.photo(s, s)
@@ -704,6 +920,14 @@ class AutoLogin:
                    self.tg.photo(self.shots[-1], "完成")
     
     def run(self):
+        try:
+            self.login()
+        except LoginFailed as e:
+            # 浏览器此时已关闭，再慢慢上传截图
+            self.notify(False, str(e))
+            sys.exit(1)
+    
+    def login(self):
         print("\n" + "="*50)
         print("🚀 ClawCloud 自动登录")
         print("="*50 + "\n")
@@ -715,8 +939,10 @@ class AutoLogin:
         
         if not self.username or not self.password:
             self.log("缺少凭据", "ERROR")
-            self.notify(False, "凭据未配置")
-            sys.exit(1)
+            raise LoginFailed("凭据未配置")
+        
+        # 浏览器启动期间并行预取 Secret 公钥
+        self.secret.prefetch()
         
         with sync_playwright() as p:
             # 代理配置解析
@@ -724,6 +950,10 @@ class AutoLogin:
                 "headless": True,
                 "args": [
                     '--no-sandbox',
+                    '--disable-setuid-sandbox',
+                    '--disable-dev-shm-usage',
+                    '--disable-gpu',
+                    '--blink-settings=imagesEnabled=false',
                     '--disable-blink-features=AutomationControlled',
                     '--disable-infobars',
                     '--exclude-switches=enable-automation',
@@ -747,12 +977,30 @@ class AutoLogin:
                     self.log(f"代理配置解析失败: {e}", "ERROR")
 
             browser = p.chromium.launch(**launch_args)
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36'
-            )
-            page = context.new_page()
-            page.add_init_script("""
+            context_args = {
+                "service_workers": 'block',
+                "viewport": {'width': 1920, 'height': 1080},
+                "user_agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36'
+            }
+            state_loaded = False
+            if STORAGE_STATE and os.path.exists(STORAGE_STATE):
+                try:
+                    context = browser.new_context(storage_state=STORAGE_STATE, **context_args)
+                    state_loaded = True
+                    self.log(f"加载登录状态: {STORAGE_STATE}", "SUCCESS")
+                except Exception as e:
+                    # 状态文件损坏时删除，避免之后每次运行都失败
+                    self.log(f"登录状态文件无效，已忽略: {e}", "WARN")
+                    try:
+                        os.remove(STORAGE_STATE)
+                    except OSError:
+                        pass
+            if not state_loaded:
+                context = browser.new_context(**context_args)
+            # 只拦截统计域名：全量路由会让每个请求都等 Python 处理，time.sleep 期间页面会卡住
+            context.route(BLOCKED_HOSTS, lambda route: route.abort())
+            # 反检测脚本挂在 context 上，保活时新开的标签页同样生效
+            context.add_init_script("""
                 // 基础反检测
                 Object.defineProperty(navigator, 'webdriver', {
                     get: () => undefined
@@ -779,6 +1027,7 @@ class AutoLogin:
                     originalQuery(parameters)
                 );
             """)
+            page = context.new_page()
             
             try:
                 # 预加载 Cookie
@@ -795,43 +1044,48 @@ class AutoLogin:
                 # 1. 访问 ClawCloud 登录入口
                 self.log("步骤1: 打开 ClawCloud 登录页", "STEP")
                 page.goto(SIGNIN_URL, timeout=60000)
-                page.wait_for_load_state('networkidle', timeout=60000)
-                time.sleep(2)
-                self.shot(page, "clawcloud")
+                if state_loaded:
+                    # 登录状态有效时登录页会直接跳到控制台
+                    try:
+                        page.wait_for_url(lambda u: 'signin' not in u.lower(), timeout=10000)
+                    except PlaywrightTimeoutError:
+                        self.log("登录状态已失效，走完整登录流程", "WARN")
+                # 仍停留在登录页时才等待 GitHub 按钮
+                if 'signin' in page.url.lower():
+                    try:
+                        self.any_visible(page, GITHUB_BTN_SELECTORS).wait_for(timeout=30000)
+                    except PlaywrightTimeoutError:
+                        self.log("未等到 GitHub 按钮", "WARN")
+                self.debug_shot(page, "clawcloud")
                 
                 # 检查当前 URL，可能已经自动跳转到区域
                 current_url = page.url
                 self.log(f"当前 URL: {current_url}")
-  
+                if 'signin' not in current_url.lower() and 'claw.cloud' in current_url:
+                    self.logged_in(page, context)
+                    return
             
-               # 2. 点击 GitHub
+                # 2. 点击 GitHub
                 self.log("步骤2: 点击 GitHub", "STEP")
-                if not self.click(page, [
-                    'button:has-text("GitHub")',
-                    'a:has-text("GitHub")',
-                    '[data-provider="github"]'
-                ], "GitHub"):
+                if not self.click(page, GITHUB_BTN_SELECTORS, "GitHub"):
                     self.log("找不到按钮", "ERROR")
-                    self.notify(False, "找不到 GitHub 按钮")
-                    sys.exit(1)
+                    self.shot(page, "找不到按钮")
+                    raise LoginFailed("找不到 GitHub 按钮")
                 
-                time.sleep(3)
-                page.wait_for_load_state('networkidle', timeout=120000)
-                self.shot(page, "点击后")
+                # 离开 signin 页：GitHub 登录页 / OAuth 授权页 / 已登录控制台
+                try:
+                    page.wait_for_url(lambda u: 'signin' not in u.lower(), timeout=120000)
+                    url = page.url
+                    if 'github.com' in url and urlparse(url).path == '/login':
+                        page.locator('input[name="login"]').wait_for(state='visible', timeout=30000)
+                except PlaywrightTimeoutError:
+                    pass
+                self.debug_shot(page, "点击后")
                 url = page.url
                 self.log(f"当前: {url}")
 
                 if 'signin' not in url.lower() and 'claw.cloud' in url and  'github.com' not in url:
-                    self.log("已登录！", "SUCCESS")
-                    # 检测区域
-                    self.detect_region(url)
-                    self.keepalive(page)
-                    # 提取并保存新 Cookie
-                    new = self.get_session(context)
-                    if new:
-                        self.save_cookie(new)
-                    self.notify(True)
-                    print("\n✅ 成功！\n")
+                    self.logged_in(page, context)
                     return
                 
 
@@ -842,8 +1096,7 @@ class AutoLogin:
                 if 'github.com/login' in url or 'github.com/session' in url:
                     if not self.login_github(page, context):
                         self.shot(page, "登录失败")
-                        self.notify(False, "GitHub 登录失败")
-                        sys.exit(1)
+                        raise LoginFailed("GitHub 登录失败")
                 elif 'github.com/login/oauth/authorize' in url:
                     self.log("Cookie 有效", "SUCCESS")
                     self.oauth(page)
@@ -852,17 +1105,16 @@ class AutoLogin:
                 self.log("步骤4: 等待重定向", "STEP")
                 if not self.wait_redirect(page):
                     self.shot(page, "重定向失败")
-                    self.notify(False, "重定向失败")
-                    sys.exit(1)
+                    raise LoginFailed("重定向失败")
                 
-                self.shot(page, "重定向成功")
+                self.debug_shot(page, "重定向成功")
                 
                 # 5. 验证
                 self.log("步骤5: 验证", "STEP")
                 current_url = page.url
                 if 'claw.cloud' not in current_url or 'signin' in current_url.lower():
-                    self.notify(False, "验证失败")
-                    sys.exit(1)
+                    self.shot(page, "验证失败")
+                    raise LoginFailed("验证失败")
                 
                 # 再次确认区域检测
                 if not self.detected_region:
@@ -870,6 +1122,7 @@ class AutoLogin:
                 
                 # 6. 保活（使用检测到的区域 URL）
                 self.keepalive(page)
+                self.save_state(context)
                 
                 # 7. 提取并保存新 Cookie
                 self.log("步骤6: 更新 Cookie", "STEP")
@@ -886,13 +1139,14 @@ class AutoLogin:
                     print(f"📍 区域: {self.detected_region}")
                 print("="*50 + "\n")
                 
+            except LoginFailed:
+                raise
             except Exception as e:
                 self.log(f"异常: {e}", "ERROR")
                 self.shot(page, "异常")
                 import traceback
                 traceback.print_exc()
-                self.notify(False, str(e))
-                sys.exit(1)
+                raise LoginFailed(str(e)) from e
             finally:
                 browser.close()
 